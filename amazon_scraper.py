@@ -1,93 +1,217 @@
-import requests
-from bs4 import BeautifulSoup
-import json
+from selectolax.parser import HTMLParser
+import orjson
 import os
 from datetime import datetime
 import uuid
-import time
+import asyncio
+import httpx
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from vector_db_qdrant import QdrantVectorDB
 from PIL import Image
-import io
+import base64
+import numpy as np
 import torch
-from transformers import CLIPProcessor, CLIPModel
-from typing import List, Dict
+from transformers import CLIPProcessor, CLIPTokenizerFast
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+from itertools import islice
+from config import EmbeddingConfig
+from clip_model import CLIP_MODEL_NAME, CLIP_MAX_TEXT_LENGTH, build_image_transform, get_features, open_image, inference_context, load_clip_model
+import embedding_cache
 
 # Configuration
 OUTPUT_DIR = "amazon_products"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 PRODUCTS_FILE = os.path.join(OUTPUT_DIR, "products.json")
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+MAX_CONCURRENT_DOWNLOADS = 64
 
-# Initialize CLIP model for image embeddings
+# CLIP model for image embeddings, loaded lazily so embedding worker processes own their copy
+EMBEDDING_DIM = 512
 device = "cuda" if torch.cuda.is_available() else "cpu"
-model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "4" if device == "cpu" else "1"))
+model = None
+processor = None
+image_transform = None
 
-def get_image_embedding(image_url: str) -> List[float]:
-    """Generate embedding for product image using CLIP with dimension validation"""
+def init_model(num_threads: Optional[int] = None):
+    """Load the CLIP model and processor into this process if not loaded yet"""
+    global model, processor, image_transform
+    if model is None:
+        model = load_clip_model(device, num_threads=num_threads)
+        processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+        image_transform = build_image_transform(processor)
+        if not isinstance(processor.tokenizer, CLIPTokenizerFast):
+            print(f"Warning: expected the Rust-backed CLIPTokenizerFast, got {type(processor.tokenizer).__name__}")
+
+def _init_worker(num_threads: int):
+    # Split the cores between workers to avoid intra-op thread oversubscription
+    torch.set_num_threads(num_threads)
+    init_model(num_threads)
+
+def create_embedding_executor() -> Executor:
+    """Create a pool of embedding worker processes, or a single in-process embedding thread"""
+    if EMBEDDING_WORKERS <= 1:
+        # One thread: the tokenizer, TensorRT context and embedding cache are not thread-safe
+        return ThreadPoolExecutor(max_workers=1)
+    return ProcessPoolExecutor(
+        max_workers=EMBEDDING_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(max(1, (os.cpu_count() or 1) // EMBEDDING_WORKERS),)
+    )
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Yield successive lists of at most size items"""
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+def create_session() -> httpx.AsyncClient:
+    """Create an HTTP/2 client whose keep-alive pool is shared by page, image and insert requests"""
+    return httpx.AsyncClient(
+        http2=True,
+        headers=HEADERS,
+        timeout=10.0,
+        limits=httpx.Limits(max_connections=MAX_CONCURRENT_DOWNLOADS, max_keepalive_connections=32)
+    )
+
+async def fetch_bytes(session: httpx.AsyncClient, url: str) -> bytes:
+    """Fetch the raw body of url"""
+    response = await session.get(url)
+    response.raise_for_status()
+    return response.content
+
+async def fetch_image_bytes(session: httpx.AsyncClient, semaphore: asyncio.Semaphore, image_url: str) -> Optional[bytes]:
+    """Download a product image, returning None on failure"""
     if not image_url:
-        return [0.0] * 512
-        
+        return None
+
+    try:
+        async with semaphore:
+            return await fetch_bytes(session, image_url)
+    except Exception as e:
+        print(f"Error downloading image {image_url}: {e}")
+        return None
+
+def decode_image(image_bytes: bytes) -> Optional[Image.Image]:
+    """Decode raw image bytes to an RGB image, returning None on failure"""
     try:
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
-        image = Image.open(io.BytesIO(response.content))
-        inputs = processor(images=image, return_tensors="pt", padding=True)
-        with torch.no_grad():
-            image_features = model.get_image_features(**inputs)
-        
-        embedding = image_features[0].tolist()
-        if len(embedding) != 512:
-            raise ValueError(f"Invalid embedding dimension: expected 512, got {len(embedding)}")
-        return embedding
+        return open_image(image_bytes)
     except Exception as e:
-        print(f"Error generating image embedding: {e}")
-        return [0.0] * 512  # Return proper zero vector
+        print(f"Error decoding image: {e}")
+        return None
+
+def get_batch_embeddings(texts: List[str], images: List[Optional[bytes]]) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """Generate CLIP text and image embeddings for a batch in a single forward per encoder.
+
+    Embeddings already in the cache are reused and each distinct text or image
+    is run through CLIP only once. Texts are deduplicated on their
+    whitespace- and case-normalized full text, images on their exact bytes.
+    Missing or undecodable images get a zero vector
+    so results stay aligned with the inputs.
+    """
+    text_keys = [embedding_cache.text_key(text) for text in texts]
+    image_keys = [embedding_cache.image_key(image) if image else None for image in images]
+
+    embeddings: Dict[str, np.ndarray] = {}
+    for key in set(text_keys).union(key for key in image_keys if key):
+        cached = embedding_cache.lookup(key)
+        if cached is not None:
+            embeddings[key] = cached
+
+    missing_texts: Dict[str, str] = {}
+    for key, text in zip(text_keys, texts):
+        if key not in embeddings:
+            missing_texts.setdefault(key, text)
+
+    decoded: Dict[str, Optional[Image.Image]] = {}
+    for key, image in zip(image_keys, images):
+        if key and key not in embeddings and key not in decoded:
+            decoded[key] = decode_image(image)
+    missing_images = {key: image for key, image in decoded.items() if image is not None}
+
+    if missing_texts or missing_images:
+        init_model()
+        text_inputs = processor(
+            text=list(missing_texts.values()),
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=CLIP_MAX_TEXT_LENGTH
+        ).to(device) if missing_texts else {}
+        pixel_values = torch.stack([
+            image_transform(image) for image in missing_images.values()
+        ]).to(device) if missing_images else None
+
+        with inference_context(device):
+            text_features, image_features = get_features(
+                model,
+                input_ids=text_inputs.get("input_ids"),
+                attention_mask=text_inputs.get("attention_mask"),
+                pixel_values=pixel_values
+            )
+
+        if text_features is not None:
+            if text_features.shape[-1] != EMBEDDING_DIM:
+                raise ValueError(f"Invalid embedding dimension: expected {EMBEDDING_DIM}, got {text_features.shape[-1]}")
+            for key, embedding in zip(missing_texts, text_features.detach().float().cpu().numpy()):
+                embeddings[key] = embedding
+                embedding_cache.store(key, embedding)
+
+        if image_features is not None:
+            for key, embedding in zip(missing_images, image_features.detach().float().cpu().numpy()):
+                embeddings[key] = embedding
+                embedding_cache.store(key, embedding)
 
-def truncate_text(text: str, max_length: int = 50) -> str:
-    """Truncate text to max_length words to avoid sequence length issues"""
-    words = text.split()
-    if len(words) > max_length:
-        return ' '.join(words[:max_length]) + '...'
-    return text
+    zero_embedding = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    text_embeddings = [embeddings[key] for key in text_keys]
+    image_embeddings = [embeddings.get(key, zero_embedding) if key else zero_embedding for key in image_keys]
+    return text_embeddings, image_embeddings
 
-def scrape_amazon_products(search_term: str = "laptop", max_pages: int = 3) -> List[Dict]:
+def encode_embedding(embedding: np.ndarray) -> str:
+    """Pack an embedding as a base64 float16 buffer for the insert request"""
+    return base64.b64encode(np.asarray(embedding, dtype=np.float16).tobytes()).decode()
+
+async def scrape_amazon_products(session: httpx.AsyncClient, search_term: str = "laptop", max_pages: int = 3) -> List[Dict]:
     """Scrape real Amazon products for given search term"""
     products = []
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept-Language": "en-US,en;q=0.9",
-    }
     
     for page in range(1, max_pages + 1):
         try:
             url = f"https://www.amazon.com/s?k={search_term}&page={page}"
             print(f"Scraping page {page}: {url}")
-            response = requests.get(url, headers=headers)
+            response = await session.get(url)
             response.raise_for_status()
+            html = response.text
             
-            soup = BeautifulSoup(response.text, 'html.parser')
+            tree = HTMLParser(html)
             
             # Find all product containers - updated selectors
-            product_containers = soup.find_all('div', {'data-component-type': 's-search-result'})
+            product_containers = tree.css('div[data-component-type="s-search-result"]')
             print(f"Found {len(product_containers)} product containers on page {page}")
             
             for item in product_containers:
                 try:
                     # Extract product details with more robust checks
-                    title_elem = item.find('h2')
+                    title_elem = item.css_first('h2')
                     if not title_elem:
                         print("Skipping item - no title found")
                         continue
                         
-                    title = title_elem.text.strip()
-                    product_url = f"https://www.amazon.com{title_elem.find('a')['href']}" if title_elem.find('a') else ""
+                    title = title_elem.text().strip()
+                    link_elem = title_elem.css_first('a')
+                    product_url = f"https://www.amazon.com{link_elem.attributes['href']}" if link_elem else ""
                     
-                    price_whole = item.find('span', {'class': 'a-price-whole'})
-                    price_fraction = item.find('span', {'class': 'a-price-fraction'})
-                    price = f"${price_whole.text}{price_fraction.text}" if price_whole and price_fraction else "Price not available"
+                    price_whole = item.css_first('span.a-price-whole')
+                    price_fraction = item.css_first('span.a-price-fraction')
+                    price = f"${price_whole.text()}{price_fraction.text()}" if price_whole and price_fraction else "Price not available"
                     
-                    image_elem = item.find('img', {'class': 's-image'})
-                    image_url = image_elem['src'] if image_elem else ""
+                    image_elem = item.css_first('img.s-image')
+                    image_url = image_elem.attributes['src'] if image_elem else ""
                     
                     product_id = str(uuid.uuid4())
                     
@@ -108,7 +232,7 @@ def scrape_amazon_products(search_term: str = "laptop", max_pages: int = 3) -> L
                     continue
                     
             # Respectful delay between pages
-            time.sleep(5)  # Increased delay to avoid rate limiting
+            await asyncio.sleep(5)  # Increased delay to avoid rate limiting
             
         except Exception as e:
             print(f"Error scraping page {page}: {str(e)}")
@@ -119,56 +243,77 @@ def scrape_amazon_products(search_term: str = "laptop", max_pages: int = 3) -> L
 
 def save_products(products: List[Dict]):
     """Save scraped products to JSON file"""
-    with open(PRODUCTS_FILE, 'w') as f:
-        json.dump(products, f, indent=2)
+    with open(PRODUCTS_FILE, 'wb') as f:
+        f.write(orjson.dumps(products, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+
+async def embed_chunk(executor: Executor, texts: List[str], images: List[Optional[bytes]]) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """Run get_batch_embeddings on the embedding executor so downloads keep running"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, get_batch_embeddings, texts, images)
+
+async def insert_chunk(chunk: List[Dict], session: httpx.AsyncClient, semaphore: asyncio.Semaphore, executor: Executor):
+    """Embed one chunk of products and insert it with a single bulk request"""
+    try:
+        # Download the chunk's images concurrently, then embed the whole chunk at once
+        texts = [f"{product['title']}. {product['description']}" for product in chunk]
+        # Products sharing an image URL share a single download
+        image_urls = list(dict.fromkeys(product['image_url'] for product in chunk))
+        downloads = await asyncio.gather(*[
+            fetch_image_bytes(session, semaphore, image_url) for image_url in image_urls
+        ])
+        images_by_url = dict(zip(image_urls, downloads))
+        images = [images_by_url[product['image_url']] for product in chunk]
+        text_embeddings, image_embeddings = await embed_chunk(executor, texts, images)
+    except Exception as e:
+        print(f"Error embedding batch of {len(chunk)} products: {e}")
+        return
 
-def insert_to_vector_db(products: List[Dict]):
+    documents = [{
+        "text": f"{product['title']}. {product['description']}",
+        "text_embedding_b64": encode_embedding(text_embedding),
+        "image_embedding_b64": encode_embedding(image_embedding),
+        "metadata": {
+            "id": product["id"],
+            "title": product["title"],
+            "price": product["price"],
+            "image_url": product["image_url"],
+            "scraped_at": product["scraped_at"]
+        }
+    } for product, text_embedding, image_embedding in zip(chunk, text_embeddings, image_embeddings)]
+
+    try:
+        response = await session.post(
+            "http://localhost:8000/documents/bulk",
+            content=orjson.dumps({"docs": documents}),
+            headers={"Content-Type": "application/json"}
+        )
+        if response.status_code != 200:
+            print(f"Failed to insert batch of {len(chunk)} products: {response.text}")
+    except Exception as e:
+        print(f"Error inserting batch of {len(chunk)} products: {e}")
+
+async def insert_to_vector_db(products: List[Dict], session: httpx.AsyncClient):
     """Insert products with text and image embeddings into vector DB"""
-    for product in products:
-        try:
-            # Get text and image embeddings with dimension validation
-            truncated_text = truncate_text(f"{product['title']}. {product['description']}")
-            # Get text embedding and verify dimension
-            text_features = model.get_text_features(
-                **processor(text=truncated_text, return_tensors="pt", padding=True, truncation=True)
-            )
-            text_embedding = text_features[0].tolist()
-            actual_dim = len(text_embedding)
-            print(f"Text embedding dimension: {actual_dim}")
-            if actual_dim != 512:
-                print(f"Warning: Expected 512 dimensions but got {actual_dim}, adjusting collection expectations")
-            
-            image_embedding = get_image_embedding(product['image_url'])
-            
-            document = {
-                "text": f"{product['title']}. {product['description']}",
-                "text_embedding": text_embedding,
-                "image_embedding": image_embedding,
-                "metadata": {
-                    "id": product["id"],
-                    "title": product["title"],
-                    "price": product["price"],
-                    "image_url": product["image_url"],
-                    "scraped_at": product["scraped_at"]
-                }
-            }
-            
-            response = requests.post(
-                "http://localhost:8000/documents",
-                json=document
-            )
-            
-            if response.status_code != 200:
-                print(f"Failed to insert product {product['id']}: {response.text}")
-                
-        except Exception as e:
-            print(f"Error inserting product {product['id']}: {e}")
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    executor = create_embedding_executor()
+    try:
+        # Chunks run concurrently so downloads overlap with embedding on the executor
+        await asyncio.gather(*[
+            insert_chunk(chunk, session, semaphore, executor)
+            for chunk in batched(products, EmbeddingConfig.BATCH_SIZE)
+        ])
+    finally:
+        executor.shutdown()
+
+async def main():
+    async with create_session() as session:
+        print("Scraping Amazon products...")
+        products = await scrape_amazon_products(session)
+        print(f"Scraped {len(products)} products")
+        save_products(products)
+        print("Inserting products to vector database...")
+        await insert_to_vector_db(products, session)
+        print("Done!")
 
 if __name__ == "__main__":
-    print("Scraping Amazon products...")
-    products = scrape_amazon_products()
-    print(f"Scraped {len(products)} products")
-    save_products(products)
-    print("Inserting products to vector database...")
-    insert_to_vector_db(products)
-    print("Done!")
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -1,6 +1,8 @@
 import requests
+import asyncio
+import httpx
 from bs4 import BeautifulSoup
-import json
+import orjson
 import os
 from datetime import datetime
 from typing import List, Dict
@@ -21,26 +23,39 @@ PRODUCT_CATEGORIES = [
     "/homepod/",
     "/accessories/"
 ]
+MAX_CONCURRENT_DOWNLOADS = 32
+INSERT_BATCH_SIZE = 64
 
 def setup_directories():
     """Create necessary directories for storing data"""
     os.makedirs(IMAGE_DIR, exist_ok=True)
 
-def download_image(url: str, product_id: str) -> str:
+async def download_image(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url: str, product_id: str) -> str:
     """Download product image and return local path"""
     try:
-        response = requests.get(url, stream=True)
-        if response.status_code == 200:
-            ext = url.split('.')[-1].split('?')[0]
-            image_path = os.path.join(IMAGE_DIR, f"{product_id}.{ext}")
-            with open(image_path, 'wb') as f:
-                for chunk in response.iter_content(1024):
-                    f.write(chunk)
-            return image_path
+        async with semaphore:
+            async with client.stream("GET", url) as response:
+                if response.status_code == 200:
+                    ext = url.split('.')[-1].split('?')[0]
+                    image_path = os.path.join(IMAGE_DIR, f"{product_id}.{ext}")
+                    with open(image_path, 'wb') as f:
+                        async for chunk in response.aiter_bytes(1024):
+                            f.write(chunk)
+                    return image_path
     except Exception as e:
         print(f"Failed to download image: {e}")
     return ""
 
+async def download_images(products: List[Dict]):
+    """Download all product images concurrently and record their local paths"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    async with httpx.AsyncClient(http2=True, timeout=10.0) as client:
+        paths = await asyncio.gather(*[
+            download_image(client, semaphore, product["image_url"], product["id"]) for product in products
+        ])
+    for product, path in zip(products, paths):
+        product["image_path"] = path
+
 def generate_mock_apple_products() -> List[Dict]:
     """Generate mock Apple products for demonstration"""
     products = []
@@ -69,14 +84,15 @@ def scrape_apple_products() -> List[Dict]:
 
 def save_products(products: List[Dict]):
     """Save scraped products to JSON file"""
-    with open(PRODUCTS_FILE, 'w') as f:
-        json.dump(products, f, indent=2)
+    with open(PRODUCTS_FILE, 'wb') as f:
+        f.write(orjson.dumps(products, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
 
 def insert_to_vector_db(products: List[Dict]):
-    """Insert products into vector database using the FastAPI endpoint"""
-    for product in products:
-        try:
-            document = {
+    """Insert products into vector database using the FastAPI bulk endpoint"""
+    with requests.Session() as session:
+        for start in range(0, len(products), INSERT_BATCH_SIZE):
+            batch = products[start:start + INSERT_BATCH_SIZE]
+            documents = [{
                 "text": f"{product['title']}. {product['description']}",
                 "metadata": {
                     "id": product["id"],
@@ -87,18 +103,20 @@ def insert_to_vector_db(products: List[Dict]):
                     "image_path": product["image_path"],
                     "scraped_at": product["scraped_at"]
                 }
-            }
-            
-            response = requests.post(
-                "http://localhost:8000/documents",
-                json=document
-            )
-            
-            if response.status_code != 200:
-                print(f"Failed to insert product {product['id']}: {response.text}")
-                
-        except Exception as e:
-            print(f"Error inserting product {product['id']}: {e}")
+            } for product in batch]
+
+            try:
+                response = session.post(
+                    "http://localhost:8000/documents/bulk",
+                    data=orjson.dumps({"docs": documents}),
+                    headers={"Content-Type": "application/json"}
+                )
+
+                if response.status_code != 200:
+                    print(f"Failed to insert batch of {len(batch)} products: {response.text}")
+
+            except Exception as e:
+                print(f"Error inserting batch of {len(batch)} products: {e}")
 
 if __name__ == "__main__":
     setup_directories()
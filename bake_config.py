@@ -0,0 +1,35 @@
+import py_compile
+from pathlib import Path
+
+FROZEN_FILE = Path(__file__).parent / '_config_frozen.py'
+
+def bake_config():
+    """Resolve config.ini plus environment overrides once and write them as plain constants"""
+    # Remove any previous output first so config.py falls back to live parsing
+    if FROZEN_FILE.exists():
+        FROZEN_FILE.unlink()
+
+    from config import MilvusConfig, EmbeddingConfig
+
+    values = {
+        "MILVUS_URI": MilvusConfig.URI,
+        "MILVUS_API_KEY": MilvusConfig.API_KEY,
+        "MILVUS_PORT": MilvusConfig.PORT,
+        "MILVUS_COLLECTION_NAME": MilvusConfig.COLLECTION_NAME,
+        "MILVUS_VECTOR_DIMENSION": MilvusConfig.VECTOR_DIMENSION,
+        "MILVUS_REPLICA_NUMBER": MilvusConfig.REPLICA_NUMBER,
+        "INDEX_PARAMS": MilvusConfig.get_index_params(),
+        "SEARCH_PARAMS": MilvusConfig.get_search_params(),
+        "EMBEDDING_MODEL_NAME": EmbeddingConfig.MODEL_NAME,
+        "EMBEDDING_BATCH_SIZE": EmbeddingConfig.BATCH_SIZE,
+        "EMBEDDING_DEVICE": EmbeddingConfig.DEVICE,
+    }
+
+    lines = ['"""Generated by bake_config.py - do not edit. Delete this file to parse config.ini again."""', '']
+    lines += [f"{name} = {value!r}" for name, value in values.items()]
+    FROZEN_FILE.write_text('\n'.join(lines) + '\n')
+    py_compile.compile(str(FROZEN_FILE), doraise=True)
+    print(f"Wrote {FROZEN_FILE}")
+
+if __name__ == "__main__":
+    bake_config()
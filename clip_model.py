@@ -0,0 +1,332 @@
+import os
+import io
+import logging
+from contextlib import contextmanager
+from typing import Optional, Tuple
+import torch
+from PIL import Image
+from torchvision import transforms as T
+from transformers import CLIPModel, CLIPProcessor, CLIPTokenizerFast
+
+try:
+    import onnxruntime as ort
+except ImportError:  # onnxruntime is only needed for the quantized CPU path
+    ort = None
+
+try:
+    import tensorrt as trt
+except ImportError:  # tensorrt is only needed for the GPU engine path
+    trt = None
+
+try:
+    import tritonclient.grpc as grpcclient
+    from tritonclient.utils import np_to_triton_dtype
+except ImportError:  # tritonclient is only needed when CLIP is served by Triton
+    grpcclient = None
+
+logger = logging.getLogger(__name__)
+
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+ONNX_MODEL_DIR = os.getenv("CLIP_ONNX_DIR", "onnx_models")
+VISION_ONNX_FILE = "clip_vision_int8.onnx"
+TEXT_ONNX_FILE = "clip_text_int8.onnx"
+VISION_FP32_ONNX_FILE = "clip_vision_fp32.onnx"
+TEXT_FP32_ONNX_FILE = "clip_text_fp32.onnx"
+VISION_TRT_ENGINE_FILE = "clip_vision_fp16.plan"
+CLIP_IMAGE_SIZE = 224
+CLIP_MAX_TEXT_LENGTH = 77
+# gRPC address of a Triton server hosting clip_vision/clip_text, e.g. localhost:8001
+TRITON_URL = os.getenv("CLIP_TRITON_URL")
+
+def autocast_dtype() -> torch.dtype:
+    """Use bfloat16 on Ampere or newer GPUs and float16 on older ones"""
+    return torch.bfloat16 if torch.cuda.get_device_capability(0)[0] >= 8 else torch.float16
+
+@contextmanager
+def inference_context(device: str):
+    """No-grad scope that also enables mixed-precision autocast on CUDA"""
+    with torch.no_grad():
+        if device == "cuda":
+            with torch.autocast("cuda", dtype=autocast_dtype()):
+                yield
+        else:
+            yield
+
+def open_image(image_bytes: bytes) -> Image.Image:
+    """Decode image bytes to RGB, letting the JPEG decoder downscale towards the CLIP input size"""
+    image = Image.open(io.BytesIO(image_bytes))
+    # draft() only ever shrinks to a size still covering the request, so the crop is unaffected
+    image.draft("RGB", (CLIP_IMAGE_SIZE, CLIP_IMAGE_SIZE))
+    return image.convert("RGB")
+
+def build_image_transform(processor: CLIPProcessor) -> T.Compose:
+    """torchvision pipeline matching the CLIP image preprocessing, without per-call processor overhead"""
+    image_processor = processor.image_processor
+    return T.Compose([
+        T.Resize(image_processor.size["shortest_edge"], interpolation=T.InterpolationMode.BICUBIC),
+        T.CenterCrop((image_processor.crop_size["height"], image_processor.crop_size["width"])),
+        T.ToTensor(),
+        T.Normalize(mean=image_processor.image_mean, std=image_processor.image_std)
+    ])
+
+class VisionEncoder(torch.nn.Module):
+    """CLIP vision tower followed by its projection head"""
+
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.vision_model = model.vision_model
+        self.visual_projection = model.visual_projection
+
+    def forward(self, pixel_values):
+        pooled_output = self.vision_model(pixel_values=pixel_values).pooler_output
+        return self.visual_projection(pooled_output)
+
+class TextEncoder(torch.nn.Module):
+    """CLIP text tower followed by its projection head"""
+
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.text_model = model.text_model
+        self.text_projection = model.text_projection
+
+    def forward(self, input_ids, attention_mask):
+        pooled_output = self.text_model(input_ids=input_ids, attention_mask=attention_mask).pooler_output
+        return self.text_projection(pooled_output)
+
+def _compile_encoder(encoder: torch.nn.Module, example_inputs: tuple) -> torch.jit.ScriptModule:
+    """Trace an encoder and freeze it with TorchScript inference optimizations"""
+    traced = torch.jit.trace(encoder, example_inputs)
+    return torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+class TorchScriptCLIPModel:
+    """CLIP encoders compiled once with TorchScript.
+
+    Each encoder falls back to eager execution if tracing fails or the traced
+    graph does not reproduce the eager output.
+    """
+
+    def __init__(self, model: CLIPModel, device: str):
+        self.vision_encoder = VisionEncoder(model).eval()
+        self.text_encoder = TextEncoder(model).eval()
+
+        # Trace under the same autocast settings used at inference so the casts are recorded
+        tolerance = 1e-4 if device == "cpu" else 1e-2
+        with inference_context(device):
+            try:
+                traced = _compile_encoder(
+                    self.vision_encoder,
+                    (torch.zeros(1, 3, 224, 224, device=device),)
+                )
+
+                # Traced at batch 1 but used on larger batches, so check one
+                check = torch.randn(4, 3, 224, 224, generator=torch.Generator().manual_seed(0)).to(device)
+                expected = self.vision_encoder(check)
+                actual = traced(check)
+                if not torch.allclose(expected, actual, atol=tolerance):
+                    raise ValueError("traced output does not match eager output")
+                self.vision_encoder = traced
+            except Exception as e:
+                logger.warning("TorchScript tracing of CLIP vision encoder failed, using eager: %s", str(e))
+
+            try:
+                tokenizer = CLIPTokenizerFast.from_pretrained(CLIP_MODEL_NAME)
+                example = tokenizer(["x"], return_tensors="pt", padding=True).to(device)
+                traced = _compile_encoder(self.text_encoder, (example["input_ids"], example["attention_mask"]))
+
+                # Tracing can bake in the example sequence length, so check a longer input
+                check = tokenizer(["a longer sentence to validate the traced text encoder"], return_tensors="pt", padding=True).to(device)
+                expected = self.text_encoder(check["input_ids"], check["attention_mask"])
+                actual = traced(check["input_ids"], check["attention_mask"])
+                if not torch.allclose(expected, actual, atol=tolerance):
+                    raise ValueError("traced output does not match eager output")
+                self.text_encoder = traced
+            except Exception as e:
+                logger.warning("TorchScript tracing of CLIP text encoder failed, using eager: %s", str(e))
+
+    def get_image_features(self, pixel_values: torch.Tensor, **kwargs) -> torch.Tensor:
+        return self.vision_encoder(pixel_values)
+
+    def get_text_features(self, input_ids: torch.Tensor, attention_mask: torch.Tensor = None, **kwargs) -> torch.Tensor:
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        return self.text_encoder(input_ids, attention_mask)
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+class ONNXCLIPModel:
+    """Quantized INT8 CLIP encoders served through ONNX Runtime.
+
+    Exposes the same get_image_features/get_text_features calls as CLIPModel
+    so callers do not need to know which backend is active.
+    """
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, num_threads: Optional[int] = None):
+        sess_options = ort.SessionOptions()
+        sess_options.intra_op_num_threads = num_threads or os.cpu_count()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.vision_session = ort.InferenceSession(
+            os.path.join(model_dir, VISION_ONNX_FILE),
+            sess_options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.text_session = ort.InferenceSession(
+            os.path.join(model_dir, TEXT_ONNX_FILE),
+            sess_options,
+            providers=["CPUExecutionProvider"]
+        )
+
+    def get_image_features(self, pixel_values: torch.Tensor, **kwargs) -> torch.Tensor:
+        outputs = self.vision_session.run(None, {"pixel_values": pixel_values.cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+    def get_text_features(self, input_ids: torch.Tensor, attention_mask: torch.Tensor = None, **kwargs) -> torch.Tensor:
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        outputs = self.text_session.run(None, {
+            "input_ids": input_ids.cpu().numpy(),
+            "attention_mask": attention_mask.cpu().numpy()
+        })
+        return torch.from_numpy(outputs[0])
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+class TensorRTVisionEncoder:
+    """CLIP vision encoder running as a serialized TensorRT FP16 engine.
+
+    Inputs and outputs stay FP32 on the device; buffers are torch CUDA tensors
+    so no separate CUDA memory management is needed.
+    """
+
+    def __init__(self, engine_path: str = os.path.join(ONNX_MODEL_DIR, VISION_TRT_ENGINE_FILE)):
+        runtime = trt.Runtime(trt.Logger(trt.Logger.WARNING))
+        with open(engine_path, "rb") as f:
+            self.engine = runtime.deserialize_cuda_engine(f.read())
+        self.context = self.engine.create_execution_context()
+        self.tensor_names = [self.engine.get_tensor_name(i) for i in range(self.engine.num_io_tensors)]
+
+    def __call__(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        pixel_values = pixel_values.to("cuda", torch.float32).contiguous()
+        self.context.set_input_shape("pixel_values", tuple(pixel_values.shape))
+        embeds = torch.empty(tuple(self.context.get_tensor_shape("embeds")), dtype=torch.float32, device="cuda")
+        buffers = {"pixel_values": pixel_values, "embeds": embeds}
+
+        # execute_v2 runs outside torch's stream, so make sure the input copy has landed
+        torch.cuda.current_stream().synchronize()
+        self.context.execute_v2([buffers[name].data_ptr() for name in self.tensor_names])
+        return embeds
+
+class TritonCLIPModel:
+    """CLIP encoders served by a Triton Inference Server.
+
+    Concurrent requests from all API workers and scraper processes are fused
+    into GPU batches by Triton's dynamic batcher, and no CLIP weights are held
+    in this process.
+    """
+
+    def __init__(self, url: str = TRITON_URL):
+        self.client = grpcclient.InferenceServerClient(url=url)
+        if not self.client.is_server_ready():
+            raise ConnectionError(f"Triton server at {url} is not ready")
+
+    def _infer(self, model_name: str, inputs: dict) -> torch.Tensor:
+        infer_inputs = []
+        for name, tensor in inputs.items():
+            array = tensor.cpu().numpy()
+            infer_input = grpcclient.InferInput(name, list(array.shape), np_to_triton_dtype(array.dtype))
+            infer_input.set_data_from_numpy(array)
+            infer_inputs.append(infer_input)
+
+        result = self.client.infer(
+            model_name,
+            inputs=infer_inputs,
+            outputs=[grpcclient.InferRequestedOutput("embeds")]
+        )
+        return torch.from_numpy(result.as_numpy("embeds"))
+
+    def get_image_features(self, pixel_values: torch.Tensor, **kwargs) -> torch.Tensor:
+        return self._infer("clip_vision", {"pixel_values": pixel_values.float()})
+
+    def get_text_features(self, input_ids: torch.Tensor, attention_mask: torch.Tensor = None, **kwargs) -> torch.Tensor:
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        return self._infer("clip_text", {"input_ids": input_ids.long(), "attention_mask": attention_mask.long()})
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+def tensorrt_engine_available(model_dir: str = ONNX_MODEL_DIR) -> bool:
+    """Check that tensorrt is installed and the vision engine was built"""
+    return trt is not None and os.path.exists(os.path.join(model_dir, VISION_TRT_ENGINE_FILE))
+
+def get_features(model, input_ids: torch.Tensor = None, attention_mask: torch.Tensor = None, pixel_values: torch.Tensor = None) -> Tuple[Optional[torch.Tensor], Optional[torch.Tensor]]:
+    """Run the text and image encoders for one batch in a single call.
+
+    Either input may be omitted. Works with every backend returned by
+    load_clip_model. The embeddings are the unnormalized projections, the same
+    as get_text_features/get_image_features, so they stay comparable with
+    vectors already stored in the collection.
+    """
+    text_embeds = None
+    image_embeds = None
+    if input_ids is not None:
+        text_embeds = model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+    if pixel_values is not None:
+        image_embeds = model.get_image_features(pixel_values=pixel_values)
+    return text_embeds, image_embeds
+
+def onnx_model_available(model_dir: str = ONNX_MODEL_DIR) -> bool:
+    """Check that onnxruntime is installed and both quantized encoders were exported"""
+    return ort is not None and all(
+        os.path.exists(os.path.join(model_dir, name)) for name in (VISION_ONNX_FILE, TEXT_ONNX_FILE)
+    )
+
+def load_clip_model(device: str, num_threads: Optional[int] = None):
+    """Load CLIP for inference.
+
+    When CLIP_TRITON_URL is set the encoders run on that Triton server. On CPU the INT8 ONNX encoders are preferred; otherwise the TorchScript
+    encoders are used, with the vision encoder swapped for a TensorRT engine on
+    CUDA when one has been built. num_threads caps the ONNX Runtime intra-op
+    threads (all cores by default).
+    """
+    if TRITON_URL and grpcclient is not None:
+        try:
+            model = TritonCLIPModel()
+            logger.info("Using Triton CLIP encoders at %s", TRITON_URL)
+            return model
+        except Exception as e:
+            logger.warning("Triton server unavailable, loading CLIP locally: %s", str(e))
+
+    if device == "cpu" and onnx_model_available():
+        try:
+            model = ONNXCLIPModel(num_threads=num_threads)
+            logger.info("Using quantized ONNX CLIP encoders from %s", ONNX_MODEL_DIR)
+            return model
+        except Exception as e:
+            logger.warning("Failed to load ONNX CLIP encoders, falling back to PyTorch: %s", str(e))
+
+    model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).to(device)
+    model.eval()
+    try:
+        clip_model = TorchScriptCLIPModel(model, device)
+    except Exception as e:
+        logger.warning("TorchScript compilation of CLIP failed, using eager model: %s", str(e))
+        return model
+
+    if device == "cuda" and tensorrt_engine_available():
+        try:
+            clip_model.vision_encoder = TensorRTVisionEncoder()
+            logger.info("Using TensorRT CLIP vision engine from %s", ONNX_MODEL_DIR)
+        except Exception as e:
+            logger.warning("Failed to load TensorRT CLIP vision engine, using TorchScript: %s", str(e))
+    return clip_model
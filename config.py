@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 from typing import Dict, Any
 import logging
+from functools import lru_cache
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
@@ -29,7 +30,13 @@ def load_config() -> configparser.ConfigParser:
     
     return config
 
-config = load_config()
+try:
+    # Pre-baked constants written by bake_config.py; skips config.ini parsing entirely
+    import _config_frozen as frozen
+except ImportError:
+    frozen = None
+
+config = load_config() if frozen is None else None
 
 class ConfigValidator:
     @staticmethod
@@ -58,55 +65,142 @@ class ConfigValidator:
         except Exception as e:
             raise ConfigError(f"Config error: {str(e)}")
 
+    @staticmethod
+    def env_override(value, env_var: str):
+        """Return a set environment variable in place of an already resolved value"""
+        return os.getenv(env_var) or value
+
+    @staticmethod
+    def get_with_env_override(config: configparser.ConfigParser, section: str, key: str, env_var: str) -> str:
+        """Get config value, letting a set environment variable take precedence"""
+        value = os.getenv(env_var)
+        if value:
+            return value
+        try:
+            return config.get(section, key)
+        except Exception as e:
+            raise ConfigError(f"Config error: {str(e)}")
+
 class MilvusConfig:
     REQUIRED_KEYS = ['uri', 'api_key', 'collection_name', 'vector_dimension']
     
-    try:
-        ConfigValidator.validate_section(config, 'milvus_cloud', REQUIRED_KEYS)
-        
-        URI = ConfigValidator.get_with_fallback(config, 'milvus_cloud', 'uri', 'MILVUS_URI')
-        API_KEY = ConfigValidator.get_with_fallback(config, 'milvus_cloud', 'api_key', 'MILVUS_API_KEY')
-        PORT = ConfigValidator.get_with_fallback(config, 'milvus_cloud', 'port', 'MILVUS_PORT') or "443"
-        COLLECTION_NAME = ConfigValidator.get_with_fallback(config, 'milvus_cloud', 'collection_name')
-        VECTOR_DIMENSION = int(ConfigValidator.get_with_fallback(config, 'milvus_cloud', 'vector_dimension'))
-    except Exception as e:
-        logger.error("Milvus configuration error: %s", str(e))
-        raise ConfigError(f"Invalid Milvus configuration: {str(e)}")
+    if frozen is not None:
+        URI = frozen.MILVUS_URI
+        API_KEY = frozen.MILVUS_API_KEY
+        PORT = frozen.MILVUS_PORT
+        COLLECTION_NAME = frozen.MILVUS_COLLECTION_NAME
+        VECTOR_DIMENSION = frozen.MILVUS_VECTOR_DIMENSION
+        REPLICA_NUMBER = int(ConfigValidator.env_override(frozen.MILVUS_REPLICA_NUMBER, 'MILVUS_REPLICA_NUMBER'))
+    else:
+        try:
+            ConfigValidator.validate_section(config, 'milvus_cloud', REQUIRED_KEYS)
+            
+            URI = ConfigValidator.get_with_fallback(config, 'milvus_cloud', 'uri', 'MILVUS_URI')
+            API_KEY = ConfigValidator.get_with_fallback(config, 'milvus_cloud', 'api_key', 'MILVUS_API_KEY')
+            PORT = ConfigValidator.get_with_fallback(config, 'milvus_cloud', 'port', 'MILVUS_PORT') or "443"
+            COLLECTION_NAME = ConfigValidator.get_with_fallback(config, 'milvus_cloud', 'collection_name')
+            VECTOR_DIMENSION = int(ConfigValidator.get_with_fallback(config, 'milvus_cloud', 'vector_dimension'))
+            # In-memory replicas let query nodes load-balance searches; a single replica unless configured
+            REPLICA_NUMBER = int(os.getenv('MILVUS_REPLICA_NUMBER') or config.get('milvus_cloud', 'replica_number', fallback='1'))
+        except Exception as e:
+            logger.error("Milvus configuration error: %s", str(e))
+            raise ConfigError(f"Invalid Milvus configuration: {str(e)}")
 
     @classmethod
+    @lru_cache(maxsize=1)
     def get_index_params(cls) -> Dict[str, Any]:
-        """Get index parameters with validation"""
+        """Get HNSW index build parameters with validation (cached; callers must not mutate the result)"""
+        if frozen is not None:
+            return cls._frozen_index_params()
         try:
-            ConfigValidator.validate_section(config, 'index_params', ['metric_type', 'index_type', 'nlist'])
+            ConfigValidator.validate_section(config, 'index_params', ['metric_type', 'index_type', 'm', 'ef_construction'])
+            index_type = ConfigValidator.get_with_env_override(config, 'index_params', 'index_type', 'MILVUS_INDEX_TYPE')
+            params = {
+                "M": int(ConfigValidator.get_with_env_override(config, 'index_params', 'm', 'MILVUS_HNSW_M')),
+                "efConstruction": int(ConfigValidator.get_with_env_override(config, 'index_params', 'ef_construction', 'MILVUS_HNSW_EF_CONSTRUCTION'))
+            }
+            if index_type == "HNSW_SQ":
+                # Scalar-quantized graph storage (Milvus 2.6.8+); SQ8 keeps 1 B/dim instead of 4
+                params["sq_type"] = ConfigValidator.get_with_env_override(config, 'index_params', 'sq_type', 'MILVUS_HNSW_SQ_TYPE')
+                params["refine"] = False
             return {
-                "metric_type": config.get('index_params', 'metric_type'),
-                "index_type": config.get('index_params', 'index_type'),
-                "params": {"nlist": config.getint('index_params', 'nlist')}
+                "metric_type": ConfigValidator.get_with_env_override(config, 'index_params', 'metric_type', 'MILVUS_METRIC_TYPE'),
+                "index_type": index_type,
+                "params": params
             }
         except Exception as e:
             raise ConfigError(f"Invalid index params: {str(e)}")
 
     @classmethod
+    @lru_cache(maxsize=1)
     def get_search_params(cls) -> Dict[str, Any]:
-        """Get search parameters with validation"""
+        """Get HNSW search parameters with validation (cached; callers must not mutate the result)"""
+        if frozen is not None:
+            base = frozen.SEARCH_PARAMS
+            return {
+                "metric_type": ConfigValidator.env_override(base["metric_type"], 'MILVUS_METRIC_TYPE'),
+                "params": {**base["params"], "ef": int(ConfigValidator.env_override(base["params"]["ef"], 'MILVUS_HNSW_EF'))}
+            }
         try:
-            ConfigValidator.validate_section(config, 'search_params', ['metric_type', 'nprobe'])
+            ConfigValidator.validate_section(config, 'search_params', ['metric_type', 'ef'])
             return {
-                "metric_type": config.get('search_params', 'metric_type'),
-                "params": {"nprobe": config.getint('search_params', 'nprobe')}
+                "metric_type": ConfigValidator.get_with_env_override(config, 'search_params', 'metric_type', 'MILVUS_METRIC_TYPE'),
+                "params": {"ef": int(ConfigValidator.get_with_env_override(config, 'search_params', 'ef', 'MILVUS_HNSW_EF'))}
             }
         except Exception as e:
             raise ConfigError(f"Invalid search params: {str(e)}")
 
+    @staticmethod
+    def _frozen_index_params() -> Dict[str, Any]:
+        """Baked index params with the same environment overrides as the live path"""
+        base = frozen.INDEX_PARAMS
+        index_type = ConfigValidator.env_override(base["index_type"], 'MILVUS_INDEX_TYPE')
+        params = {
+            "M": int(ConfigValidator.env_override(base["params"]["M"], 'MILVUS_HNSW_M')),
+            "efConstruction": int(ConfigValidator.env_override(base["params"]["efConstruction"], 'MILVUS_HNSW_EF_CONSTRUCTION'))
+        }
+        if index_type == "HNSW_SQ":
+            sq_type = ConfigValidator.env_override(base["params"].get("sq_type"), 'MILVUS_HNSW_SQ_TYPE')
+            if sq_type is None:
+                raise ConfigError("Invalid index params: no sq_type baked for HNSW_SQ; set MILVUS_HNSW_SQ_TYPE or re-run bake_config.py")
+            params["sq_type"] = sq_type
+            params["refine"] = False
+        return {
+            "metric_type": ConfigValidator.env_override(base["metric_type"], 'MILVUS_METRIC_TYPE'),
+            "index_type": index_type,
+            "params": params
+        }
+
+    @classmethod
+    def configure_hnsw_params(cls, vector_count: int) -> Dict[str, Any]:
+        """Pick HNSW build parameters scaled to the expected number of vectors"""
+        if vector_count < 100_000:
+            m, ef_construction = 16, 64
+        elif vector_count < 1_000_000:
+            m, ef_construction = 24, 128
+        else:
+            m, ef_construction = 32, 256
+        index_params = cls.get_index_params()
+        return {
+            "metric_type": index_params["metric_type"],
+            "index_type": index_params["index_type"],
+            "params": {**index_params["params"], "M": m, "efConstruction": ef_construction}
+        }
+
 class EmbeddingConfig:
     REQUIRED_KEYS = ['model_name', 'batch_size', 'device']
     
-    try:
-        ConfigValidator.validate_section(config, 'embedding', REQUIRED_KEYS)
-        
-        MODEL_NAME = ConfigValidator.get_with_fallback(config, 'embedding', 'model_name', 'EMBEDDING_MODEL')
-        BATCH_SIZE = int(ConfigValidator.get_with_fallback(config, 'embedding', 'batch_size', 'EMBEDDING_BATCH_SIZE'))
-        DEVICE = ConfigValidator.get_with_fallback(config, 'embedding', 'device', 'EMBEDDING_DEVICE') or "cpu"
-    except Exception as e:
-        logger.error("Embedding configuration error: %s", str(e))
-        raise ConfigError(f"Invalid embedding configuration: {str(e)}")
+    if frozen is not None:
+        MODEL_NAME = frozen.EMBEDDING_MODEL_NAME
+        BATCH_SIZE = frozen.EMBEDDING_BATCH_SIZE
+        DEVICE = frozen.EMBEDDING_DEVICE
+    else:
+        try:
+            ConfigValidator.validate_section(config, 'embedding', REQUIRED_KEYS)
+            
+            MODEL_NAME = ConfigValidator.get_with_fallback(config, 'embedding', 'model_name', 'EMBEDDING_MODEL')
+            BATCH_SIZE = int(ConfigValidator.get_with_fallback(config, 'embedding', 'batch_size', 'EMBEDDING_BATCH_SIZE'))
+            DEVICE = ConfigValidator.get_with_fallback(config, 'embedding', 'device', 'EMBEDDING_DEVICE') or "cpu"
+        except Exception as e:
+            logger.error("Embedding configuration error: %s", str(e))
+            raise ConfigError(f"Invalid embedding configuration: {str(e)}")
@@ -0,0 +1,65 @@
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Callable, Optional
+import numpy as np
+import diskcache
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./emb_cache")
+MEMORY_CACHE_SIZE = 4096
+
+_disk_cache = diskcache.Cache(CACHE_DIR)
+_memory_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+def text_key(text: str) -> str:
+    """Cache key for a text embedding, insensitive to case and whitespace"""
+    normalized = " ".join(text.lower().split())
+    return "text:" + hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def image_key(image_bytes: bytes) -> str:
+    """Cache key for an image embedding, based on the raw image bytes"""
+    return "image:" + hashlib.sha256(image_bytes).hexdigest()
+
+def lookup(key: str) -> Optional[np.ndarray]:
+    """Look up an embedding in the in-process LRU, then on disk"""
+    if key in _memory_cache:
+        _memory_cache.move_to_end(key)
+        return _memory_cache[key]
+
+    try:
+        cached = _disk_cache.get(key)
+    except Exception as e:
+        logger.warning("Embedding cache read failed: %s", str(e))
+        return None
+    if cached is None:
+        return None
+
+    embedding = cached.astype(np.float32)
+    _remember(key, embedding)
+    return embedding
+
+def store(key: str, embedding: np.ndarray):
+    """Store an embedding in memory and on disk (as float16 to halve disk usage)"""
+    _remember(key, embedding)
+    try:
+        _disk_cache.set(key, np.asarray(embedding, dtype=np.float16))
+    except Exception as e:
+        logger.warning("Embedding cache write failed: %s", str(e))
+
+def _remember(key: str, embedding: np.ndarray):
+    _memory_cache[key] = embedding
+    _memory_cache.move_to_end(key)
+    if len(_memory_cache) > MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+def get_or_compute_image(image_bytes: bytes, compute: Callable[[bytes], np.ndarray]) -> np.ndarray:
+    """Return the cached embedding for raw image bytes, computing and caching it on a miss"""
+    key = image_key(image_bytes)
+    embedding = lookup(key)
+    if embedding is None:
+        embedding = compute(image_bytes)
+        store(key, embedding)
+    return embedding
@@ -0,0 +1,92 @@
+import os
+import shutil
+import subprocess
+import argparse
+import torch
+from transformers import CLIPModel, CLIPProcessor
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from clip_model import (
+    CLIP_MODEL_NAME, ONNX_MODEL_DIR, VISION_ONNX_FILE, TEXT_ONNX_FILE,
+    VISION_FP32_ONNX_FILE, TEXT_FP32_ONNX_FILE, VISION_TRT_ENGINE_FILE, VisionEncoder, TextEncoder
+)
+
+OPSET_VERSION = 14
+TRT_MAX_BATCH_SIZE = 64
+TRITON_MODEL_REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "triton_models")
+
+def export_and_quantize(module: torch.nn.Module, example_inputs: tuple, input_names: list, dynamic_axes: dict, output_file: str):
+    """Export a module to FP32 ONNX and write a dynamically quantized INT8 copy"""
+    fp32_path = os.path.join(ONNX_MODEL_DIR, output_file.replace("_int8", "_fp32"))
+    int8_path = os.path.join(ONNX_MODEL_DIR, output_file)
+
+    torch.onnx.export(
+        module,
+        example_inputs,
+        fp32_path,
+        input_names=input_names,
+        output_names=["embeds"],
+        dynamic_axes={**dynamic_axes, "embeds": {0: "batch"}},
+        opset_version=OPSET_VERSION
+    )
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"Wrote {int8_path}")
+
+def build_tensorrt_engine():
+    """Compile the FP32 vision ONNX graph into a TensorRT FP16 engine with trtexec"""
+    onnx_path = os.path.join(ONNX_MODEL_DIR, VISION_FP32_ONNX_FILE)
+    engine_path = os.path.join(ONNX_MODEL_DIR, VISION_TRT_ENGINE_FILE)
+    subprocess.run([
+        "trtexec",
+        f"--onnx={onnx_path}",
+        "--fp16",
+        "--minShapes=pixel_values:1x3x224x224",
+        "--optShapes=pixel_values:8x3x224x224",
+        f"--maxShapes=pixel_values:{TRT_MAX_BATCH_SIZE}x3x224x224",
+        f"--saveEngine={engine_path}"
+    ], check=True)
+    print(f"Wrote {engine_path}")
+
+def write_triton_repository():
+    """Copy the FP32 ONNX encoders into the Triton model repository layout"""
+    for model_name, onnx_file in (("clip_vision", VISION_FP32_ONNX_FILE), ("clip_text", TEXT_FP32_ONNX_FILE)):
+        version_dir = os.path.join(TRITON_MODEL_REPOSITORY, model_name, "1")
+        os.makedirs(version_dir, exist_ok=True)
+        shutil.copyfile(os.path.join(ONNX_MODEL_DIR, onnx_file), os.path.join(version_dir, "model.onnx"))
+        print(f"Wrote {os.path.join(version_dir, 'model.onnx')}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export CLIP encoders to ONNX")
+    parser.add_argument("--tensorrt", action="store_true", help="also build a TensorRT FP16 vision engine (requires trtexec)")
+    parser.add_argument("--triton", action="store_true", help="also populate the Triton model repository in triton_models/")
+    args = parser.parse_args()
+
+    os.makedirs(ONNX_MODEL_DIR, exist_ok=True)
+    model = CLIPModel.from_pretrained(CLIP_MODEL_NAME)
+    model.eval()
+    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+
+    with torch.no_grad():
+        export_and_quantize(
+            VisionEncoder(model),
+            (torch.zeros(1, 3, 224, 224),),
+            ["pixel_values"],
+            {"pixel_values": {0: "batch"}},
+            VISION_ONNX_FILE
+        )
+
+        text_inputs = processor(text=["a photo of a laptop"], return_tensors="pt", padding=True)
+        export_and_quantize(
+            TextEncoder(model),
+            (text_inputs["input_ids"], text_inputs["attention_mask"]),
+            ["input_ids", "attention_mask"],
+            {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"}},
+            TEXT_ONNX_FILE
+        )
+
+    if args.tensorrt:
+        build_tensorrt_engine()
+    if args.triton:
+        write_triton_repository()
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,73 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import List
-from vector_db import VectorDBService
+from typing import List, Optional
+from vector_db import VectorDBService, ainit_pool, close_pool
+from contextlib import asynccontextmanager
 from sentence_transformers import SentenceTransformer
 from config import EmbeddingConfig, MilvusConfig
 from pymilvus import utility
 import logging
-import requests
-import io
+import httpx
+import threading
+import base64
+import numpy as np
 import torch
-from PIL import Image
-from transformers import CLIPProcessor, CLIPModel
+from transformers import CLIPProcessor
+import embedding_cache
+from clip_model import CLIP_MODEL_NAME, build_image_transform, open_image, inference_context, load_clip_model
 
 # Initialize CLIP model for image embeddings
-model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+device = "cuda" if torch.cuda.is_available() else "cpu"
+model = load_clip_model(device)
+processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+image_transform = build_image_transform(processor)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global vector_db
+    await ainit_pool()
+    try:
+        # Built after ainit_pool so it reuses that connection instead of opening its own
+        vector_db = await run_in_threadpool(VectorDBService)
+    except Exception as e:
+        logger.error(f"Service initialization failed: {str(e)}")
+        raise
+    yield
+    await http_client.aclose()
+    await vector_db.aclose()
+    close_pool()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 logger = logging.getLogger(__name__)
 
-# Initialize services
+# Shared keep-alive client so image fetches reuse TLS connections
+http_client = httpx.AsyncClient(http2=True, timeout=10.0)
+# Fast tokenizers, the TensorRT context and the embedding cache LRU are not thread-safe
+_clip_lock = threading.Lock()
+_embedder_lock = threading.Lock()
+
+# Initialize services; vector_db is created in lifespan once the connection pool is up
+vector_db: Optional[VectorDBService] = None
 try:
-    vector_db = VectorDBService()
-    embedder = SentenceTransformer(EmbeddingConfig.MODEL_NAME, device=EmbeddingConfig.DEVICE)
+    embedding_device = device if EmbeddingConfig.DEVICE == "auto" else EmbeddingConfig.DEVICE
+    embedder = SentenceTransformer(EmbeddingConfig.MODEL_NAME, device=embedding_device)
 except Exception as e:
     logger.error(f"Service initialization failed: {str(e)}")
     raise
 
+def encode_texts(texts: List[str]):
+    """Encode texts in batches into L2-normalized sentence embeddings"""
+    with _embedder_lock, torch.inference_mode():
+        return embedder.encode(
+            texts,
+            batch_size=EmbeddingConfig.BATCH_SIZE,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 5
@@ -35,8 +76,17 @@ class Document(BaseModel):
     text: str
     text_embedding: List[float] = None
     image_embedding: List[float] = None
+    # Base64-encoded float16 buffers, a compact alternative to the float lists
+    text_embedding_b64: str = None
+    image_embedding_b64: str = None
     metadata: dict = None
 
+class DocumentBatch(BaseModel):
+    docs: List[Document]
+
+# Fields returned per hit by /search
+RESULT_FIELDS = ("text", "metadata")
+
 class SearchRequest(BaseModel):
     query: str = None
     image_url: str = None
@@ -47,12 +97,12 @@ async def search(request: SearchRequest):
     try:
         if request.query:
             # Text search
-            query_embedding = embedder.encode(request.query).tolist()
-            results = vector_db.search(query_embedding, top_k=request.top_k, search_type="text")
+            query_embedding = (await run_in_threadpool(encode_texts, [request.query]))[0]
+            results = await vector_db.asearch(query_embedding, top_k=request.top_k, anns_field="text_embedding", output_fields=RESULT_FIELDS)
         elif request.image_url:
             # Image search
-            image_embedding = get_image_embedding(request.image_url)
-            results = vector_db.search(image_embedding, top_k=request.top_k, search_type="image")
+            image_embedding = await get_image_embedding(request.image_url)
+            results = await vector_db.asearch(image_embedding, top_k=request.top_k, anns_field="image_embedding", output_fields=RESULT_FIELDS)
         else:
             raise HTTPException(status_code=400, detail="Either query or image_url must be provided")
         
@@ -61,44 +111,103 @@ async def search(request: SearchRequest):
         logger.error(f"Search error: {str(e)}")
         raise HTTPException(status_code=500, detail="Search failed")
 
-def get_image_embedding(image_url: str) -> List[float]:
-    """Generate embedding for product image using CLIP"""
+def compute_image_embedding(image_bytes: bytes) -> np.ndarray:
+    """Run the CLIP vision encoder on raw image bytes"""
+    image = open_image(image_bytes)
+    pixel_values = image_transform(image).unsqueeze(0).to(device)
+    with inference_context(device):
+        image_features = model.get_image_features(pixel_values=pixel_values)
+    return image_features[0].detach().float().cpu().numpy()
+
+def cached_image_embedding(image_bytes: bytes) -> np.ndarray:
+    """Return the CLIP embedding for image bytes, cached by content hash"""
+    with _clip_lock:
+        return embedding_cache.get_or_compute_image(image_bytes, compute_image_embedding)
+
+async def get_image_embedding(image_url: str) -> np.ndarray:
+    """Fetch a product image and embed it with CLIP off the event loop"""
     try:
-        response = requests.get(image_url)
-        image = Image.open(io.BytesIO(response.content))
-        inputs = processor(images=image, return_tensors="pt", padding=True)
-        with torch.no_grad():
-            image_features = model.get_image_features(**inputs)
-        return image_features[0].tolist()
+        response = await http_client.get(image_url)
+        response.raise_for_status()
+        return await run_in_threadpool(cached_image_embedding, response.content)
     except Exception as e:
         logger.error(f"Error generating image embedding: {e}")
         raise HTTPException(status_code=400, detail=f"Image processing failed: {e}")
 
+def decode_embedding(encoded: str) -> np.ndarray:
+    """Decode a base64 float16 embedding buffer to float32 values"""
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.float16).astype(np.float32)
+
+def as_embedding(values: Optional[List[float]]) -> Optional[np.ndarray]:
+    """Convert a client-supplied float list to a float32 array, treating empty as missing"""
+    if not values:
+        return None
+    return np.asarray(values, dtype=np.float32)
+
+def text_embedding_of(document: Document) -> Optional[np.ndarray]:
+    """Return the client-supplied text embedding, if any"""
+    if document.text_embedding_b64:
+        return decode_embedding(document.text_embedding_b64)
+    return as_embedding(document.text_embedding)
+
+def image_embedding_of(document: Document) -> Optional[np.ndarray]:
+    """Return the client-supplied image embedding, if any"""
+    if document.image_embedding_b64:
+        return decode_embedding(document.image_embedding_b64)
+    return as_embedding(document.image_embedding)
+
+def build_row(document: Document, text_embedding: np.ndarray) -> dict:
+    """Convert a request document into a collection row"""
+    row = {
+        "text": document.text,
+        "text_embedding": text_embedding,
+        "image_embedding": image_embedding_of(document)
+    }
+
+    # Add metadata if provided
+    if document.metadata:
+        row["metadata"] = document.metadata
+    return row
+
 @app.post("/documents")
 async def add_document(document: Document):
     try:
         # Generate embeddings if not provided
-        text_embedding = document.text_embedding or embedder.encode(document.text).tolist()
-        image_embedding = document.image_embedding
-        
-        # Prepare document for insertion
-        doc = {
-            "text": document.text,
-            "text_embedding": text_embedding,
-            "image_embedding": image_embedding
-        }
-        
-        # Add metadata if provided
-        if document.metadata:
-            doc["metadata"] = document.metadata
-        
+        text_embedding = text_embedding_of(document)
+        if text_embedding is None:
+            text_embedding = (await run_in_threadpool(encode_texts, [document.text]))[0]
+
         # Insert into vector DB
-        vector_db.collection.insert([doc])
+        await run_in_threadpool(vector_db.insert, [build_row(document, text_embedding)])
         return {"status": "success"}
     except Exception as e:
         logger.error(f"Document insertion error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Document insertion failed: {str(e)}")
 
+@app.post("/documents/bulk")
+async def add_documents_bulk(batch: DocumentBatch):
+    if not batch.docs:
+        return {"status": "success", "inserted": 0}
+
+    try:
+        # Encode all documents missing a text embedding in one batched call
+        text_embeddings = [text_embedding_of(document) for document in batch.docs]
+        missing = [i for i, embedding in enumerate(text_embeddings) if embedding is None]
+        if missing:
+            encoded = await run_in_threadpool(encode_texts, [batch.docs[i].text for i in missing])
+            for i, embedding in zip(missing, encoded):
+                text_embeddings[i] = embedding
+
+        # Single insert round trip for the whole batch
+        await run_in_threadpool(vector_db.insert, [
+            build_row(document, text_embedding)
+            for document, text_embedding in zip(batch.docs, text_embeddings)
+        ])
+        return {"status": "success", "inserted": len(batch.docs)}
+    except Exception as e:
+        logger.error(f"Bulk document insertion error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Bulk document insertion failed: {str(e)}")
+
 @app.get("/health")
 async def health_check():
     return {
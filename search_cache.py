@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import threading
+from types import MappingProxyType
+from typing import Any, Dict, Hashable, List, Mapping, Optional, Tuple
+import numpy as np
+from cachetools import TTLCache
+
+SearchResults = List[Dict[str, Any]]
+
+# Batches of ~16 queries with at most 2 in flight avoid the server saturation cliff
+SEARCH_BATCH_SIZE = 16
+search_slots = threading.BoundedSemaphore(2)
+async_search_slots = asyncio.Semaphore(2)
+# ef must cover top_k; a few candidates per requested hit keeps recall stable
+EF_PER_RESULT = 4
+# Shared read-only stand-in for missing metadata, so hits don't each allocate an empty dict
+EMPTY_METADATA = MappingProxyType({})
+
+def scaled_ef(top_k: int, base_ef: int) -> int:
+    """Search ef for top_k, never below the backend's base ef"""
+    return max(top_k * EF_PER_RESULT, base_ef)
+
+def build_hit(fields: Optional[Mapping[str, Any]], output_fields: Tuple[str, ...], score: float, hit_id: Any) -> Dict[str, Any]:
+    """Build the result dict for one search hit from its stored fields"""
+    fields = fields or EMPTY_METADATA
+    result = {field: fields.get(field) for field in output_fields}
+    if result.get("metadata", EMPTY_METADATA) is None:
+        result["metadata"] = EMPTY_METADATA
+    result["score"] = score
+    result["id"] = hit_id
+    return result
+
+class SearchCache:
+    """Query-result cache for vector search.
+
+    Results are keyed on the query vector plus the search params (top_k, output
+    fields, ...). Exact repeats are found by hashing the float16-rounded query
+    vector. Near duplicates are found by comparing the query against recently
+    cached query vectors with the same params and reusing their hits when the
+    cosine similarity is above similarity_threshold. Services clear() the cache
+    after their own writes; the ttl bounds staleness for writes made elsewhere.
+    Hits are copied on the way in and out, so callers may modify them freely.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300, similarity_threshold: float = 0.99):
+        self.maxsize = maxsize
+        self.similarity_threshold = similarity_threshold
+        self._results: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        # Ring buffer of normalized query vectors backing the near-duplicate lookup
+        self._vectors: Optional[np.ndarray] = None
+        self._param_ids = np.full(maxsize, -1, dtype=np.int64)
+        self._param_index: Dict[Hashable, int] = {}
+        self._keys: List[Optional[Tuple[bytes, Hashable]]] = [None] * maxsize
+        self._next = 0
+
+    @staticmethod
+    def _key(query: np.ndarray, params: Hashable) -> Tuple[bytes, Hashable]:
+        digest = hashlib.blake2b(np.asarray(query, dtype=np.float16).tobytes(), digest_size=16).digest()
+        return digest, params
+
+    @staticmethod
+    def _normalize(query) -> Optional[np.ndarray]:
+        vector = np.asarray(query, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def get(self, query, params: Hashable) -> Optional[SearchResults]:
+        """Return cached results for this query or a near-identical one"""
+        results = self._lookup(query, params)
+        return None if results is None else [dict(hit) for hit in results]
+
+    def _lookup(self, query, params: Hashable) -> Optional[Tuple[Dict[str, Any], ...]]:
+        key = self._key(query, params)
+        with self._lock:
+            results = self._results.get(key)
+            if results is not None or self._vectors is None or params not in self._param_index:
+                return results
+
+            vector = self._normalize(query)
+            if vector is None or vector.shape[0] != self._vectors.shape[1]:
+                return None
+            similarities = self._vectors @ vector
+            similarities[self._param_ids != self._param_index[params]] = -1.0
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            return self._results.get(self._keys[best])
+
+    def put(self, query, params: Hashable, results: SearchResults):
+        """Cache the results of a search"""
+        key = self._key(query, params)
+        vector = self._normalize(query)
+        stored = tuple(dict(hit) for hit in results)
+        with self._lock:
+            self._results[key] = stored
+            if vector is None:
+                return
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            elif vector.shape[0] != self._vectors.shape[1]:
+                return
+            self._vectors[self._next] = vector
+            self._param_ids[self._next] = self._param_index.setdefault(params, len(self._param_index))
+            self._keys[self._next] = key
+            self._next = (self._next + 1) % self.maxsize
+
+    def clear(self):
+        """Drop all cached results, e.g. after the collection changed"""
+        with self._lock:
+            self._results.clear()
+            self._vectors = None
+            self._param_ids[:] = -1
+            self._param_index.clear()
+            self._keys = [None] * self.maxsize
+            self._next = 0
@@ -1,136 +1,327 @@
-from pymilvus import connections, Collection, utility
+from pymilvus import connections, Collection, utility, MilvusException, Status, MilvusClient, AsyncMilvusClient
+from pymilvus.client.types import LoadState
+from tenacity import AsyncRetrying, Retrying, stop_after_attempt, wait_exponential_jitter, retry_if_exception, before_sleep_log
 from config import MilvusConfig
+from search_cache import SearchCache, SEARCH_BATCH_SIZE, search_slots, async_search_slots, scaled_ef, build_hit
 import logging
-import backoff
-from typing import List, Dict, Any
+import asyncio
+import threading
+import numpy as np
+from functools import lru_cache
+from itertools import repeat
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 
 logger = logging.getLogger(__name__)
 
+CONNECTION_ALIAS = "default"
+_pool_lock = threading.Lock()
+_initialized = False
+_client = None
+
+@lru_cache(maxsize=128)
+def _search_params_for(top_k: int) -> Dict[str, Any]:
+    """Search params with the configured ef raised for large top_k (cached; callers must not mutate the result)"""
+    base = MilvusConfig.get_search_params()
+    ef = scaled_ef(top_k, base["params"]["ef"])
+    return {**base, "params": {**base["params"], "ef": ef}}
+
+def _result_from_client_hit(hit: Dict[str, Any], output_fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """Build the result dict for a MilvusClient search hit"""
+    return build_hit(hit["entity"], output_fields, hit["distance"], hit["id"])
+
 class VectorDBError(Exception):
     """Custom exception for Vector DB operations"""
     pass
 
-class VectorDBService:
-    def __init__(self, reset: bool = False):
-        self._connect_with_retry()
+def _is_transient(exc: BaseException) -> bool:
+    """Only network failures are worth retrying; bad credentials or config never succeed"""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    return isinstance(exc, MilvusException) and exc.code == Status.CONNECT_FAILED
+
+_RETRY_POLICY = dict(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=0.1, max=2.0),
+    retry=retry_if_exception(_is_transient),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True
+)
+
+def _connect():
+    connections.connect(
+        alias=CONNECTION_ALIAS,
+        uri=MilvusConfig.URI,
+        token=MilvusConfig.API_KEY,
+        secure=True
+    )
+
+def _connect_with_retry():
+    """Establish secure connection to Milvus with retry logic"""
+    try:
+        for attempt in Retrying(**_RETRY_POLICY):
+            with attempt:
+                _connect()
+        logger.info("Successfully connected to Milvus")
+    except Exception as e:
+        logger.error(f"Failed to connect to Milvus: {str(e)}")
+        raise VectorDBError(f"Connection failed: {str(e)}")
+
+async def _aconnect_with_retry():
+    """Async variant of _connect_with_retry that backs off without blocking the event loop"""
+    try:
+        async for attempt in AsyncRetrying(**_RETRY_POLICY):
+            with attempt:
+                await asyncio.to_thread(_connect)
+        logger.info("Successfully connected to Milvus")
+    except Exception as e:
+        logger.error(f"Failed to connect to Milvus: {str(e)}")
+        raise VectorDBError(f"Connection failed: {str(e)}")
+
+def init_pool():
+    """Open the shared Milvus connection once per process"""
+    global _initialized
+    with _pool_lock:
+        if _initialized and connections.has_connection(CONNECTION_ALIAS):
+            return
+        _connect_with_retry()
+        _initialized = True
+
+async def ainit_pool():
+    """Open the shared Milvus connection from async code, e.g. the app lifespan"""
+    global _initialized
+    if _initialized and connections.has_connection(CONNECTION_ALIAS):
+        return
+    await _aconnect_with_retry()
+    with _pool_lock:
+        _initialized = True
+
+def get_client() -> MilvusClient:
+    """Return the process-wide MilvusClient used for searches, creating it on first use"""
+    global _client
+    with _pool_lock:
+        if _client is None:
+            _client = MilvusClient(uri=MilvusConfig.URI, token=MilvusConfig.API_KEY)
+        return _client
+
+def close_pool():
+    """Close the shared Milvus connection and search client"""
+    global _initialized, _client
+    with _pool_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+        if connections.has_connection(CONNECTION_ALIAS):
+            connections.disconnect(CONNECTION_ALIAS)
+        _initialized = False
+
+@dataclass(frozen=True)
+class SchemaSpec:
+    """Collection layout: id/text/metadata scalar fields plus the listed (name, dim, index_params) vector fields"""
+    collection_name: str
+    description: str
+    vector_fields: Tuple[Tuple[str, int, Dict[str, Any]], ...]
+
+    @property
+    def default_anns_field(self) -> str:
+        return self.vector_fields[0][0]
+
+def multimodal_schema() -> SchemaSpec:
+    """Text and image embeddings side by side, both CLIP-sized"""
+    dim, index_params = MilvusConfig.VECTOR_DIMENSION, MilvusConfig.get_index_params()
+    return SchemaSpec(
+        MilvusConfig.COLLECTION_NAME,
+        "Multimodal document search collection",
+        (("text_embedding", dim, index_params), ("image_embedding", dim, index_params))
+    )
+
+class _MilvusBase:
+    """Connection handling shared by every Milvus-backed service"""
+
+    def __init__(self):
+        # Reuse the process-wide connection instead of reconnecting per instance
+        if not connections.has_connection(CONNECTION_ALIAS):
+            init_pool()
+
+    def health_check(self) -> bool:
+        """Check if the vector DB connection is healthy"""
+        try:
+            return connections.has_connection(CONNECTION_ALIAS)
+        except Exception:
+            return False
+
+class VectorDBService(_MilvusBase):
+    def __init__(self, schema: Optional[SchemaSpec] = None, reset: bool = False):
+        super().__init__()
+        self.schema = schema or multimodal_schema()
+        self.default_anns_field = self.schema.default_anns_field
         if reset:
             self._reset_collection()
         self.collection = self._setup_collection()
+        # Resolved once so searches skip get_client()'s lock
+        self.client = get_client()
+        self._search_cache = SearchCache()
+        # AsyncMilvusClient binds its gRPC channel to the running loop, so asearch opens it on first use
+        self._aclient = None
 
     def _reset_collection(self):
         """Force reset the collection by dropping it if exists"""
+        collection_name = self.schema.collection_name
         try:
-            if utility.has_collection(MilvusConfig.COLLECTION_NAME):
-                utility.drop_collection(MilvusConfig.COLLECTION_NAME)
-                logger.info(f"Dropped existing collection: {MilvusConfig.COLLECTION_NAME}")
+            if utility.has_collection(collection_name):
+                utility.drop_collection(collection_name)
+                logger.info(f"Dropped existing collection: {collection_name}")
         except Exception as e:
             logger.error(f"Failed to reset collection: {str(e)}")
             raise VectorDBError(f"Collection reset failed: {str(e)}")
 
-    @backoff.on_exception(backoff.expo,
-                         Exception,
-                         max_tries=3,
-                         logger=logger)
-    def _connect_with_retry(self):
-        """Establish secure connection to Milvus with retry logic"""
-        try:
-            connections.connect(
-                alias="default",
-                uri=MilvusConfig.URI,
-                token=MilvusConfig.API_KEY,
-                secure=True
-            )
-            logger.info("Successfully connected to Milvus")
-        except Exception as e:
-            logger.error(f"Failed to connect to Milvus: {str(e)}")
-            raise VectorDBError(f"Connection failed: {str(e)}")
-
     def _setup_collection(self) -> Collection:
         """Create or load the vector collection with validation"""
         try:
             from pymilvus import FieldSchema, CollectionSchema, DataType
             
-            collection_name = MilvusConfig.COLLECTION_NAME
-            logger.info(f"Checking for existing collection: {collection_name}")
+            collection_name = self.schema.collection_name
+            logger.debug("Checking for existing collection: %s", collection_name)
             
             if not utility.has_collection(collection_name):
-                logger.info(f"Collection {collection_name} not found, creating new one")
-                
-                # Get actual embedding dimension from sample
-                from transformers import CLIPProcessor, CLIPModel
-                model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-                processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-                sample_input = processor(text="sample", return_tensors="pt", padding=True)
-                sample_embedding = model.get_text_features(**sample_input)[0].tolist()
-                embedding_dim = len(sample_embedding)
-                logger.info(f"Detected embedding dimension: {embedding_dim}")
+                logger.debug("Collection %s not found, creating new one", collection_name)
                 
                 fields = [
                     FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
                     FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=2000),
-                    FieldSchema(name="text_embedding", dtype=DataType.FLOAT_VECTOR, dim=embedding_dim),
-                    FieldSchema(name="image_embedding", dtype=DataType.FLOAT_VECTOR, dim=embedding_dim),
+                    *(FieldSchema(name=name, dtype=DataType.FLOAT_VECTOR, dim=dim) for name, dim, _ in self.schema.vector_fields),
                     FieldSchema(name="metadata", dtype=DataType.JSON)
                 ]
                 
-                schema = CollectionSchema(fields, "Multimodal document search collection")
+                schema = CollectionSchema(fields, self.schema.description)
                 collection = Collection(collection_name, schema)
-                logger.info(f"Created collection schema for {collection_name}")
                 
                 # Create indexes
-                index_params = MilvusConfig.get_index_params()
-                logger.info(f"Creating text embedding index with params: {index_params}")
-                collection.create_index(
-                    field_name="text_embedding",
-                    index_params=index_params
-                )
-                
-                search_params = MilvusConfig.get_search_params()
-                logger.info(f"Creating image embedding index with params: {search_params}")
-                collection.create_index(
-                    field_name="image_embedding",
-                    index_params=search_params
-                )
-                
-                logger.info(f"Successfully created new collection: {collection_name}")
+                for name, _, index_params in self.schema.vector_fields:
+                    collection.create_index(
+                        field_name=name,
+                        index_params=index_params
+                    )
+                logger.debug("Created collection %s with vector fields: %s", collection_name, self.schema.vector_fields)
             else:
-                logger.info(f"Collection {collection_name} exists, loading it")
                 collection = Collection(collection_name)
-                logger.info(f"Successfully loaded existing collection: {collection_name}")
+                self._check_vector_fields(collection)
+                logger.debug("Using existing collection: %s", collection_name)
             
-            logger.info(f"Loading collection {collection_name} into memory")
-            collection.load()
-            logger.info(f"Collection {collection_name} loaded with {collection.num_entities} entities")
+            # load() is a round trip plus server-side checks even when nothing needs loading
+            if utility.load_state(collection_name) != LoadState.Loaded:
+                logger.debug("Loading collection %s into memory", collection_name)
+                collection.load(replica_number=MilvusConfig.REPLICA_NUMBER)
             return collection
         except Exception as e:
             logger.error(f"Collection setup failed: {str(e)}")
             raise VectorDBError(f"Collection setup failed: {str(e)}")
 
-    def search(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-        """Perform vector similarity search using text embeddings"""
-        search_params = {
-            "data": [query_embedding],
-            "anns_field": "text_embedding",
-            "param": MilvusConfig.get_search_params(),
-            "limit": top_k,
-            "output_fields": ["text", "metadata"]
+    def _check_vector_fields(self, collection: Collection):
+        """Fail fast when an existing collection's vector fields don't match the schema spec"""
+        from pymilvus import DataType
+
+        existing = {
+            field.name: int(field.params["dim"])
+            for field in collection.schema.fields
+            if field.dtype == DataType.FLOAT_VECTOR
         }
-        
+        expected = {name: dim for name, dim, _ in self.schema.vector_fields}
+        if existing != expected:
+            raise VectorDBError(
+                f"Collection {collection.name} has vector fields {existing}, expected {expected}"
+            )
+
+    def insert(self, rows: List[Dict[str, Any]]):
+        """Insert rows into the collection and drop cached search results they may change"""
+        try:
+            self.collection.insert(rows)
+        except Exception as e:
+            logger.error(f"Insert failed: {str(e)}")
+            raise VectorDBError(f"Insert operation failed: {str(e)}")
+        finally:
+            # Clear even on failure; a partial insert may already be visible
+            self._search_cache.clear()
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5, output_fields: Sequence[str] = ("text",), anns_field: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Perform vector similarity search on anns_field (the schema's first vector field by default), returning only output_fields per hit"""
+        # No-op for float32 C-contiguous input; pymilvus serializes the buffer without boxing floats
+        query_embedding = np.ascontiguousarray(query_embedding, dtype=np.float32)
+        output_fields = tuple(output_fields)
+        anns_field = anns_field or self.default_anns_field
+        cached = self._search_cache.get(query_embedding, (top_k, output_fields, anns_field))
+        if cached is not None:
+            return cached
+
         try:
-            results = self.collection.search(**search_params)
-            return [{
-                "text": hit.entity.get("text"),
-                "metadata": hit.entity.get("metadata") or {},
-                "score": hit.score,
-                "id": hit.id
-            } for hit in results[0]]
+            results = self.client.search(
+                collection_name=self.schema.collection_name,
+                data=[query_embedding],
+                search_params=_search_params_for(top_k),
+                limit=top_k,
+                output_fields=output_fields,
+                anns_field=anns_field
+            )
+            hits = list(map(_result_from_client_hit, results[0], repeat(output_fields)))
+            self._search_cache.put(query_embedding, (top_k, output_fields, anns_field), hits)
+            return hits
         except Exception as e:
             logger.error(f"Search failed: {str(e)}")
             raise VectorDBError(f"Search operation failed: {str(e)}")
 
-    def health_check(self) -> bool:
-        """Check if the vector DB connection is healthy"""
+    async def asearch(self, query_embedding: np.ndarray, top_k: int = 5, output_fields: Sequence[str] = ("text",), anns_field: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Async variant of search that does not hold a threadpool worker while the query is in flight"""
+        query_embedding = np.ascontiguousarray(query_embedding, dtype=np.float32)
+        output_fields = tuple(output_fields)
+        anns_field = anns_field or self.default_anns_field
+        cached = self._search_cache.get(query_embedding, (top_k, output_fields, anns_field))
+        if cached is not None:
+            return cached
+
+        if self._aclient is None:
+            self._aclient = AsyncMilvusClient(uri=MilvusConfig.URI, token=MilvusConfig.API_KEY)
         try:
-            return connections.has_connection("default")
-        except Exception:
-            return False
+            async with async_search_slots:
+                results = await self._aclient.search(
+                    collection_name=self.schema.collection_name,
+                    data=[query_embedding],
+                    search_params=_search_params_for(top_k),
+                    limit=top_k,
+                    output_fields=output_fields,
+                    anns_field=anns_field
+                )
+            hits = list(map(_result_from_client_hit, results[0], repeat(output_fields)))
+            self._search_cache.put(query_embedding, (top_k, output_fields, anns_field), hits)
+            return hits
+        except Exception as e:
+            logger.error(f"Async search failed: {str(e)}")
+            raise VectorDBError(f"Search operation failed: {str(e)}")
+
+    async def aclose(self):
+        """Close the async client, if one was opened"""
+        if self._aclient is not None:
+            await self._aclient.close()
+            self._aclient = None
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5, output_fields: Sequence[str] = ("text",), anns_field: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """Search several query vectors with one round trip per SEARCH_BATCH_SIZE queries"""
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        output_fields = tuple(output_fields)
+        anns_field = anns_field or self.default_anns_field
+        results = []
+        try:
+            for start in range(0, len(query_embeddings), SEARCH_BATCH_SIZE):
+                with search_slots:
+                    batch_results = self.client.search(
+                        collection_name=self.schema.collection_name,
+                        data=list(query_embeddings[start:start + SEARCH_BATCH_SIZE]),
+                        search_params=_search_params_for(top_k),
+                        limit=top_k,
+                        output_fields=output_fields,
+                        anns_field=anns_field
+                    )
+                results.extend(list(map(_result_from_client_hit, hits, repeat(output_fields))) for hits in batch_results)
+            return results
+        except Exception as e:
+            logger.error(f"Batch search failed: {str(e)}")
+            raise VectorDBError(f"Batch search operation failed: {str(e)}")
@@ -1,20 +1,77 @@
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http import models
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Sequence, Tuple
 import logging
+import os
+import asyncio
 import numpy as np
+import threading
+from functools import lru_cache
+from itertools import repeat
+from search_cache import SearchCache, SEARCH_BATCH_SIZE, search_slots, async_search_slots, scaled_ef, build_hit
 
 logger = logging.getLogger(__name__)
 
+HNSW_M = 24
+HNSW_EF_CONSTRUCT = 128
+# Bulk uploads stream in batches; loads of BULK_LOAD_MIN_POINTS or more defer HNSW indexing until done
+INSERT_BATCH_SIZE = 256
+UPLOAD_PARALLEL = 4
+BULK_LOAD_MIN_POINTS = 10000
+# Restored after a bulk load when the collection reports no usable threshold of its own
+INDEXING_THRESHOLD = 20000
+# Point QDRANT_URL at a Qdrant server to use gRPC; otherwise an on-disk local store is used
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "true").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_PATH = os.getenv("QDRANT_PATH", "./qdrant_data")
+_client_lock = threading.Lock()
+_client = None
+# Bulk loads each toggle the collection's indexing threshold, so they must not overlap
+_bulk_load_lock = threading.Lock()
+
+def _server_options() -> Dict[str, Any]:
+    return {
+        "url": QDRANT_URL,
+        "api_key": QDRANT_API_KEY,
+        "prefer_grpc": QDRANT_PREFER_GRPC,
+        "grpc_port": QDRANT_GRPC_PORT
+    }
+
+def get_client() -> QdrantClient:
+    """Return the process-wide Qdrant client, creating it on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            if QDRANT_URL:
+                _client = QdrantClient(**_server_options())
+            else:
+                # Persisted so inserted points survive restarts instead of being re-uploaded
+                _client = QdrantClient(path=QDRANT_PATH)
+        return _client
+
+@lru_cache(maxsize=128)
+def _search_params_for(top_k: int) -> models.SearchParams:
+    """Search params with hnsw_ef raised above the ef_construct default for large top_k"""
+    return models.SearchParams(hnsw_ef=scaled_ef(top_k, HNSW_EF_CONSTRUCT))
+
+def _result_from_point(point: models.ScoredPoint, output_fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """Build the result dict for a scored point"""
+    return build_hit(point.payload, output_fields, point.score, point.id)
+
 class VectorDBError(Exception):
     """Custom exception for Vector DB operations"""
     pass
 
 class QdrantVectorDB:
     def __init__(self, collection_name: str = "document_search", vector_size: int = 512):
-        self.client = QdrantClient(":memory:")  # Use in-memory for demo
+        self.client = get_client()
         self.collection_name = collection_name
         self.vector_size = vector_size
+        self._search_cache = SearchCache()
+        # Opened by the first server-mode asearch; the local store is only reached through self.client
+        self._aclient = None
         
         try:
             # Create collection if it doesn't exist
@@ -25,6 +82,14 @@ class QdrantVectorDB:
                     vectors_config=models.VectorParams(
                         size=vector_size,
                         distance=models.Distance.COSINE
+                    ),
+                    hnsw_config=models.HnswConfigDiff(m=HNSW_M, ef_construct=HNSW_EF_CONSTRUCT),
+                    # INT8 copies of the vectors stay in RAM for graph traversal, 4x smaller than float32
+                    quantization_config=models.ScalarQuantization(
+                        scalar=models.ScalarQuantizationConfig(
+                            type=models.ScalarType.INT8,
+                            always_ram=True
+                        )
                     )
                 )
                 logger.info(f"Created Qdrant collection: {collection_name}")
@@ -34,49 +99,132 @@ class QdrantVectorDB:
             logger.error(f"Qdrant initialization failed: {str(e)}")
             raise VectorDBError(f"Qdrant initialization failed: {str(e)}")
 
-    def search(self, query_embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-        """Perform vector similarity search"""
+    def search(self, query_embedding: np.ndarray, top_k: int = 5, output_fields: Sequence[str] = ("text",)) -> List[Dict[str, Any]]:
+        """Perform vector similarity search, returning only output_fields per hit"""
+        query_embedding = np.ascontiguousarray(query_embedding, dtype=np.float32)
+        output_fields = tuple(output_fields)
+        cached = self._search_cache.get(query_embedding, (top_k, output_fields))
+        if cached is not None:
+            return cached
+
         try:
             results = self.client.search(
                 collection_name=self.collection_name,
                 query_vector=query_embedding,
-                limit=top_k
+                limit=top_k,
+                search_params=_search_params_for(top_k),
+                with_payload=list(output_fields)
             )
             
-            return [{
-                "text": hit.payload.get("text"),
-                "metadata": hit.payload.get("metadata") or {},
-                "score": hit.score,
-                "id": hit.id
-            } for hit in results]
+            hits = list(map(_result_from_point, results, repeat(output_fields)))
+            self._search_cache.put(query_embedding, (top_k, output_fields), hits)
+            return hits
         except Exception as e:
             logger.error(f"Search failed: {str(e)}")
             raise VectorDBError(f"Search operation failed: {str(e)}")
 
+    async def asearch(self, query_embedding: np.ndarray, top_k: int = 5, output_fields: Sequence[str] = ("text",)) -> List[Dict[str, Any]]:
+        """Async variant of search that does not hold a threadpool worker while the query is in flight"""
+        if not QDRANT_URL:
+            # The local store allows only one client per path, so reuse the sync client in a thread
+            async with async_search_slots:
+                return await asyncio.to_thread(self.search, query_embedding, top_k, output_fields)
+
+        query_embedding = np.ascontiguousarray(query_embedding, dtype=np.float32)
+        output_fields = tuple(output_fields)
+        cached = self._search_cache.get(query_embedding, (top_k, output_fields))
+        if cached is not None:
+            return cached
+
+        if self._aclient is None:
+            self._aclient = AsyncQdrantClient(**_server_options())
+        try:
+            async with async_search_slots:
+                results = await self._aclient.search(
+                    collection_name=self.collection_name,
+                    query_vector=query_embedding,
+                    limit=top_k,
+                    search_params=_search_params_for(top_k),
+                    with_payload=list(output_fields)
+                )
+            hits = list(map(_result_from_point, results, repeat(output_fields)))
+            self._search_cache.put(query_embedding, (top_k, output_fields), hits)
+            return hits
+        except Exception as e:
+            logger.error(f"Async search failed: {str(e)}")
+            raise VectorDBError(f"Search operation failed: {str(e)}")
+
+    async def aclose(self):
+        """Close the async client, if one was opened"""
+        if self._aclient is not None:
+            await self._aclient.close()
+            self._aclient = None
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5, output_fields: Sequence[str] = ("text",)) -> List[List[Dict[str, Any]]]:
+        """Search several query vectors with one request per SEARCH_BATCH_SIZE queries"""
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        output_fields = tuple(output_fields)
+        results = []
+        try:
+            for start in range(0, len(query_embeddings), SEARCH_BATCH_SIZE):
+                with search_slots:
+                    batch_results = self.client.search_batch(
+                        collection_name=self.collection_name,
+                        requests=[
+                            models.SearchRequest(vector=vector.tolist(), limit=top_k, params=_search_params_for(top_k), with_payload=list(output_fields))
+                            for vector in query_embeddings[start:start + SEARCH_BATCH_SIZE]
+                        ]
+                    )
+                results.extend(list(map(_result_from_point, hits, repeat(output_fields))) for hits in batch_results)
+            return results
+        except Exception as e:
+            logger.error(f"Batch search failed: {str(e)}")
+            raise VectorDBError(f"Batch search operation failed: {str(e)}")
+
     def insert(self, documents: List[Dict[str, Any]]):
         """Insert documents into the vector DB"""
         try:
-            points = [
-                models.PointStruct(
-                    id=doc.get("id") or idx,
-                    vector=doc["vector"],
-                    payload={
-                        "text": doc["text"],
-                        "metadata": doc.get("metadata", {})
-                    }
-                )
-                for idx, doc in enumerate(documents)
-            ]
-            
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
+            vectors = np.asarray([doc["vector"] for doc in documents], dtype=np.float32)
+            if len(documents) < BULK_LOAD_MIN_POINTS:
+                self._upload(vectors, documents)
+            else:
+                with _bulk_load_lock:
+                    # Skip indexing while loading so the server only builds the graph once
+                    previous_threshold = self._indexing_threshold()
+                    self._set_indexing_threshold(0)
+                    try:
+                        self._upload(vectors, documents)
+                    finally:
+                        self._set_indexing_threshold(previous_threshold)
+            self._search_cache.clear()
             logger.info(f"Inserted {len(documents)} documents")
         except Exception as e:
             logger.error(f"Insert failed: {str(e)}")
             raise VectorDBError(f"Insert operation failed: {str(e)}")
 
+    def _upload(self, vectors: np.ndarray, documents: List[Dict[str, Any]]):
+        # wait=True so the points are searchable before the threshold is restored and the cache cleared
+        self.client.upload_collection(
+            collection_name=self.collection_name,
+            vectors=vectors,
+            payload=({"text": doc["text"], "metadata": doc.get("metadata", {})} for doc in documents),
+            ids=(doc.get("id") or idx for idx, doc in enumerate(documents)),
+            batch_size=INSERT_BATCH_SIZE,
+            parallel=UPLOAD_PARALLEL,
+            wait=True
+        )
+
+    def _indexing_threshold(self) -> int:
+        threshold = self.client.get_collection(self.collection_name).config.optimizer_config.indexing_threshold
+        # 0 only appears if an earlier bulk load died before restoring the threshold
+        return threshold or INDEXING_THRESHOLD
+
+    def _set_indexing_threshold(self, threshold: int):
+        self.client.update_collection(
+            collection_name=self.collection_name,
+            optimizer_config=models.OptimizersConfigDiff(indexing_threshold=threshold)
+        )
+
     def health_check(self) -> Dict[str, Any]:
         """Check database health and collection status"""
         try: